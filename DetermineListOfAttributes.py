@@ -1,9 +1,43 @@
-import urllib
-import urllib.parse
-import urllib.request
-import json
+import functools
+import requests
 import pandas as pd
-from typing import List
+from requests.adapters import HTTPAdapter
+from typing import List, Tuple
+from urllib.parse import urlencode
+from urllib3.util.retry import Retry
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+_BASE_URL = 'http://api.worldweatheronline.com/premium/v1/past-weather.ashx'
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=Retry(total=3, backoff_factor=0.3))
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+
+@functools.lru_cache(maxsize=4)
+def _fetch_attribute_list(api_key: str, city_name: str, date: str) -> Tuple[str, ...]:
+    """
+    This internal function retrieves the attributes available from the WorldWeatherOnline API.
+    Results are memoised, as the available attributes do not change within a session.
+
+    :param api_key: the API key obtained from 'https://www.worldweatheronline.com/developer/'. (str)
+    :param city_name: the name of the city in which the user is interested in retrieving fields. (str)
+    :param date: the start date on which the user is interested in retrieving fields. (str)
+    :return: attribute_list: a tuple of attributes which are available from the WWO API. (tuple)
+    """
+    query = {'key': api_key, 'q': city_name, 'format': 'json', 'date': '2011-01-01', 'enddate': date, 'tp': 1}
+    url_page = f'{_BASE_URL}?{urlencode(query)}'
+    json_data = json_loads(_session.get(url_page, timeout=10).content)
+    data = json_data['data']['weather']
+    astronomy_data = pd.DataFrame(data[1]['astronomy'])
+    hourly_data = pd.DataFrame(data[1]['hourly'])
+
+    return tuple(astronomy_data.keys()) + tuple(hourly_data.keys())
 
 
 class DetermineListOfAttributes(object):
@@ -45,26 +79,12 @@ class DetermineListOfAttributes(object):
         This function enables retrieval of 'attribute_list', which contains all
         available attributes which can be retrieved from the WorldWeatherOnline API.
         """
-        attribute_list = []
         if self.verbose:
             print('Retrieving attribute list...')
 
-            url_page = 'http://api.worldweatheronline.com/premium/v1/past-weather.' \
-                       'ashx?key={}&q={}&format=json&date=2011-01-01&enddate={}&tp=1'.format(self.api_key,
-                                                                                             self.city_name,
-                                                                                             self.date)
-            json_page = urllib.request.urlopen(url_page, timeout=10)
-            json_data = json.loads(json_page.read().decode())
-            data = json_data['data']['weather']
-            astronomy_data = pd.DataFrame(data[1]['astronomy'])
-            hourly_data = pd.DataFrame(data[1]['hourly'])
-
-            for key in astronomy_data.keys():
-                attribute_list.append(key)
-            for key in hourly_data.keys():
-                attribute_list.append(key)
-
-            if self.verbose:
-                print('List of available weather attributes: {}'.format(attribute_list))
-
-            return attribute_list
+        attribute_list = list(_fetch_attribute_list(self.api_key, self.city_name, self.date))
+
+        if self.verbose:
+            print('List of available weather attributes: {}'.format(attribute_list))
+
+        return attribute_list
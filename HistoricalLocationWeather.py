@@ -1,10 +1,92 @@
 import os
-import urllib
-import urllib.parse
-import urllib.request
-import json
+import re
+import time
+import threading
 import pandas as pd
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession, NEVER_EXPIRE
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+_BASE_URL = 'http://api.worldweatheronline.com/premium/v1/past-weather.ashx'
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# pandas 2.2 renamed the month-end frequency alias from 'M' to 'ME'; pandas 3 rejects 'M'.
+_MONTH_END = 'ME' if tuple(int(v) for v in pd.__version__.split('.')[:2]) >= (2, 2) else 'M'
+
+
+class _RateLimiter(object):
+    """
+    This internal class spaces the requests made with a single API key, across all
+    instances and threads, so that they start no faster than the requested rate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+
+    def reserve(self, rate_limit_rps: float) -> float:
+        """
+        This function reserves the next request slot.
+
+        :param rate_limit_rps: the maximum number of API requests made per second. (float)
+        :return: delay: the number of seconds to wait before making the request. (float)
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request)
+            self._next_request = start + 1.0 / rate_limit_rps
+            return start - now
+
+
+_rate_limiters: Dict[str, _RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _rate_limiter_for(api_key: str) -> _RateLimiter:
+    """
+    This internal function returns the rate limiter shared by all requests made with api_key,
+    as the WorldWeatherOnline request quota applies per API key.
+
+    :param api_key: the API key obtained from 'https://www.worldweatheronline.com/developer/'. (str)
+    :return: rate_limiter: the rate limiter for api_key. (_RateLimiter)
+    """
+    with _rate_limiters_lock:
+        if api_key not in _rate_limiters:
+            _rate_limiters[api_key] = _RateLimiter()
+        return _rate_limiters[api_key]
+
+
+def _build_session(cache_name: str = 'wwo_cache', pool_maxsize: int = 10) -> CachedSession:
+    """
+    This internal function builds the cached, connection-pooled session through
+    which requests to the WorldWeatherOnline API are made. The API key is
+    excluded from cache keys and is never written to the cache.
+
+    :param cache_name: the path of the SQLite response cache, without the '.sqlite' suffix. (str)
+    :param pool_maxsize: the maximum number of connections kept alive per host. (int)
+    :return: session: a session with retries and an on-disk response cache. (requests_cache CachedSession)
+    """
+    session = CachedSession(cache_name, backend='sqlite', cache_control=True, expire_after=timedelta(days=30),
+                            ignored_parameters=['key'])
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize,
+                          max_retries=Retry(total=3, backoff_factor=0.3))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 class HistoricalLocationWeather(object):
@@ -19,10 +101,33 @@ class HistoricalLocationWeather(object):
     :param end_date: The date at which to end data extraction, in the format 'YYYY-MM-DD'. (str)
     :param frequency: the frequency of extracted data, measured in hours. (int)
     :param verbose: boolean determining printing during data extraction. (bool)
-    :param csv_directory: an optional file directory to store the output. (os directory)
+    :param csv_directory: an optional file directory to store the output, or None to skip it. (os directory)
+    :param output_format: the file format of the stored output, either 'csv' or 'parquet'. (str)
+    :param attributes: an optional list of weather attributes to collect in place of the defaults. (list)
+    :param rate_limit_rps: the maximum number of API requests made per second, shared by all
+                           instances using the same api_key. (float)
+    :param cache_name: the path of the SQLite response cache, without the '.sqlite' suffix. (str)
+    :param session: an optional session to share between instances, in place of one built from cache_name.
+                    (requests_cache CachedSession)
     :return: dataset: a Pandas DataFrame containing the requested weather data. (Pandas DataFrame)
     """
 
+    _COLUMNS_REQUIRED: Tuple[str, ...] = ('date_time', 'maxtempC', 'mintempC', 'totalSnow_cm', 'sunHour', 'uvIndex',
+                                          'moon_illumination', 'moonrise', 'moonset', 'sunrise', 'sunset',
+                                          'DewPointC', 'FeelsLikeC', 'HeatIndexC', 'WindChillC', 'WindGustKmph',
+                                          'cloudcover', 'humidity', 'precipMM', 'pressure', 'tempC', 'visibility',
+                                          'winddirDegree', 'windspeedKmph')
+    _DAILY_KEYS: Tuple[str, ...] = ('date', 'maxtempC', 'mintempC', 'totalSnow_cm', 'sunHour', 'uvIndex')
+    _DTYPES: Dict[str, str] = {'maxtempC': 'Int16', 'mintempC': 'Int16', 'totalSnow_cm': 'Float32',
+                               'sunHour': 'Float32', 'uvIndex': 'Int8', 'moon_illumination': 'Int8',
+                               'DewPointC': 'Int16', 'FeelsLikeC': 'Int16', 'HeatIndexC': 'Int16',
+                               'WindChillC': 'Int16', 'WindGustKmph': 'Int16', 'cloudcover': 'Int8',
+                               'humidity': 'Int8', 'precipMM': 'Float32', 'pressure': 'Int16', 'tempC': 'Int16',
+                               'visibility': 'Int16', 'winddirDegree': 'Int16', 'windspeedKmph': 'Int16'}
+    _ASTRONOMY_COLUMNS: Tuple[str, ...] = ('moon_illumination', 'moonrise', 'moonset', 'sunrise', 'sunset')
+    _CATEGORICAL_COLUMNS: Tuple[str, ...] = ('city', 'moonrise', 'moonset', 'sunrise', 'sunset')
+    _MAX_CONCURRENT_REQUESTS: int = 5
+
     def __init__(self,
                  api_key: str,
                  city: str,
@@ -30,20 +135,40 @@ class HistoricalLocationWeather(object):
                  end_date: str,
                  frequency: int,
                  verbose: bool = True,
-                 csv_directory: str = os.getcwd()):
+                 csv_directory: Optional[str] = os.getcwd(),
+                 output_format: str = 'csv',
+                 attributes: Optional[List[str]] = None,
+                 rate_limit_rps: float = 5.0,
+                 cache_name: str = 'wwo_cache',
+                 session: Optional[CachedSession] = None):
 
-        if not all(isinstance(v, str) for v in [api_key, city, start_date, end_date, csv_directory]):
+        if not all(isinstance(v, str) for v in [api_key, city, start_date, end_date, cache_name]):
             raise TypeError("The 'api_key', 'city', 'start_date', 'end_date' "
-                            "and 'csv_directory' arguments must be string types.")
+                            "and 'cache_name' arguments must be string types.")
+        if csv_directory is not None and not isinstance(csv_directory, str):
+            raise TypeError("The 'csv_directory' argument must be a string type or None.")
         if not isinstance(frequency, int):
             raise TypeError("frequency argument must be an integer object.")
+        if attributes is not None and not (isinstance(attributes, list) and
+                                           all(isinstance(a, str) for a in attributes)):
+            raise TypeError("The 'attributes' argument must be a list of string types.")
+        if not isinstance(rate_limit_rps, (int, float)):
+            raise TypeError("The 'rate_limit_rps' argument must be a numeric type.")
 
-        end_date_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-        start_date_datetime = datetime.strptime(start_date, '%Y-%m-%d')
+        if not (_DATE_RE.match(start_date) and _DATE_RE.match(end_date)):
+            raise ValueError("The 'start_date' and 'end_date' arguments must be of the format 'YYYY-MM-DD'.")
+        end_date_datetime = pd.Timestamp(end_date)
+        start_date_datetime = pd.Timestamp(start_date)
         if start_date_datetime >= end_date_datetime:
             raise ValueError("The end_date argument cannot occur prior to the start_date argument.")
         if frequency not in [1, 3, 6, 12]:
             raise ValueError("The frequency argument (hours) must be selected from: 1, 3, 6, 12.")
+        if output_format not in ['csv', 'parquet']:
+            raise ValueError("The output_format argument must be selected from: 'csv', 'parquet'.")
+        if output_format == 'parquet' and pa is None:
+            raise ImportError("The 'parquet' output_format requires pyarrow to be installed.")
+        if rate_limit_rps <= 0:
+            raise ValueError("The rate_limit_rps argument must be greater than zero.")
 
         self.api_key = api_key
         self.city = city
@@ -54,97 +179,146 @@ class HistoricalLocationWeather(object):
         self.frequency = frequency
         self.verbose = verbose
         self.csv_directory = csv_directory
+        self.output_format = output_format
+        self.attributes = attributes
+        self.rate_limit_rps = rate_limit_rps
+
+        self._session = session if session is not None else _build_session(cache_name)
+        self._rate_limiter = _rate_limiter_for(api_key)
 
-    @staticmethod
-    def _extract_data(dataset: pd.DataFrame):
+    @classmethod
+    def _extract_data(cls, dataset: Iterable[dict], attributes: Optional[List[str]] = None):
         """
         This internal function extracts data from the output of the
-        _retrieve_this_city internal function below.
+        _get_month internal function below.
 
-        :param dataset: a json file containing extracted data. (json)
-        :returns: monthly_data: a Pandas DataFrame containing the requested weather data. (Pandas DataFrame)
+        :param dataset: an iterable of daily weather records. (iterable of dict)
+        :param attributes: an optional list of weather attributes to collect in place of the defaults. (list)
+        :returns: data: a Pandas DataFrame containing the requested weather data. (Pandas DataFrame)
         """
-        number_days = len(dataset)
-        monthly_data = pd.DataFrame()
-        for i in range(number_days):
-            d = dataset[i]
-            astronomy_data = pd.DataFrame(d['astronomy'])
-            hourly_data = pd.DataFrame(d['hourly'])
-
-            required_keys = ['date', 'maxtempC', 'mintempC', 'totalSnow_cm', 'sunHour', 'uvIndex']
-            subset_d = dict((k, d[k]) for k in required_keys if k in d)
-            weather_data = pd.DataFrame(subset_d, index=[0])
-            data = pd.concat([weather_data.reset_index(drop=True), astronomy_data], axis=1)
-            data = pd.concat([data, hourly_data], axis=1)
-            data = data.fillna(method='ffill')
-
-            data['time'] = data['time'].apply(lambda x: x.zfill(4))
-            data['time'] = data['time'].str[:2]
-            data['date_time'] = pd.to_datetime(data['date'] + ' ' + data['time'])
-
-            columns_required = ['date_time', 'maxtempC', 'mintempC', 'totalSnow_cm', 'sunHour', 'uvIndex',
-                                'moon_illumination', 'moonrise', 'moonset', 'sunrise', 'sunset',
-                                'DewPointC', 'FeelsLikeC', 'HeatIndexC', 'WindChillC', 'WindGustKmph',
-                                'cloudcover', 'humidity', 'precipMM', 'pressure', 'tempC', 'visibility',
-                                'winddirDegree', 'windspeedKmph']
-
-            data = data[columns_required]
-            data = data.loc[:, ~data.columns.duplicated()]
-            monthly_data = pd.concat([monthly_data, data])
-        return monthly_data
+        columns_required = cls._COLUMNS_REQUIRED
+        if attributes is not None:
+            columns_required = ('date_time', *dict.fromkeys(a for a in attributes if a != 'date_time'))
+        index_keys = tuple(k for k in ('date', 'time') if k not in columns_required)
+        record_columns = index_keys + columns_required[1:]
+        record_keys = set(record_columns)
+
+        records = []
+        keys_received = set()
+        for d in dataset:
+            day = {k: d[k] for k in cls._DAILY_KEYS if k in d}
+            if d.get('astronomy'):
+                day.update(d['astronomy'][0])
+            keys_received.update(day)
+            keys_received.update(d['hourly'][0] if d['hourly'] else ())
+            day = {k: v for k, v in day.items() if k in record_keys}
+            # Daily values take precedence over hourly fields of the same name (e.g. 'uvIndex').
+            for h in d['hourly']:
+                record = {k: v for k, v in h.items() if k in record_keys}
+                record.update(day)
+                records.append(record)
+        if attributes is not None and records:
+            missing_attributes = [a for a in columns_required[1:] if a not in keys_received]
+            if missing_attributes:
+                raise ValueError("The attributes {} were not found in the API response.".format(missing_attributes))
+        data = pd.DataFrame.from_records(records, columns=record_columns)
+        # Empty or non-numeric values become missing values rather than failing the cast.
+        for column, dtype in cls._DTYPES.items():
+            if column in record_keys:
+                data[column] = pd.to_numeric(data[column], errors='coerce').astype(dtype)
+
+        hours = data['time'].astype(str).str.zfill(4).str.slice(0, 2).astype('int8')
+        date_time = pd.to_datetime(data['date'], format='%Y-%m-%d', cache=True) + pd.to_timedelta(hours, unit='h')
+
+        data.drop(columns=list(index_keys), inplace=True)
+        data.insert(0, 'date_time', date_time)
+        return data
+
+    def _fetch_month(self, city: str, start_d: str, end_d: str):
+        """
+        This internal function retrieves and extracts the data for the city
+        between the start_d and end_d arguments. Requests are started no faster
+        than rate_limit_rps per second across all instances sharing the api_key.
+
+        :param city: the city which the user wishes to extract. (string)
+        :param start_d: the first date of the requested month, in the format 'YYYY-MM-DD'. (string)
+        :param end_d: the last date of the requested month, in the format 'YYYY-MM-DD'. (string)
+        :return: data_this_month: a Pandas DataFrame containing the weather data for the month. (Pandas DataFrame)
+        """
+        if self.verbose:
+            print('Retrieving data for ' + city + ' from: ' + start_d + ' to: ' + end_d)
+        query = {'key': self.api_key, 'q': city, 'format': 'json', 'includelocation': 'no',
+                 'date': start_d, 'enddate': end_d, 'tp': self.frequency}
+        if self.attributes is not None and 'isdaytime' in self.attributes:
+            query['extra'] = 'isDayTime'
+        url_page = f'{_BASE_URL}?{urlencode(query)}'
+        expire_after = NEVER_EXPIRE if end_d < datetime.now().strftime('%Y-%m-%d') else timedelta(days=30)
+        time.sleep(self._rate_limiter.reserve(self.rate_limit_rps))
+        return self._get_month(url_page, expire_after)
+
+    def _get_month(self, url_page: str, expire_after):
+        """
+        This internal function requests url_page and passes the daily records
+        of the response to _extract_data.
+
+        :param url_page: the API request url for a single month. (string)
+        :param expire_after: the cache expiry for the response. (timedelta)
+        :return: data_this_month: a Pandas DataFrame containing the weather data for the month. (Pandas DataFrame)
+        """
+        json_page = self._session.get(url_page, timeout=10, expire_after=expire_after)
+        json_data = json_loads(json_page.content)
+        if 'weather' not in json_data.get('data', {}):
+            # Errors are served with HTTP 200, so remove them from the cache before raising.
+            self._session.cache.delete(urls=[url_page])
+            raise ValueError("The WorldWeatherOnline API returned no weather data: {}".format(json_data))
+        return self._extract_data(json_data['data']['weather'], self.attributes)
 
     def _retrieve_this_city(self, city: str):
         """
         This internal function retrieves the data corresponding to the city
         specified within the input arguments, for the specified frequency between
-        the start_date_datetime and end_date_datetime arguments.
+        the start_date_datetime and end_date_datetime arguments. Months are
+        requested concurrently, at most _MAX_CONCURRENT_REQUESTS at a time.
 
         :param city: the city which the user wishes to extract. (string)
         :return: historical_data: a Pandas DataFrame containing the requested historical data. (Pandas DataFrame)
         """
         start_time = datetime.now()
 
-        list_month_begin = pd.date_range(self.start_date, self.end_date, freq='MS', closed='right')
-        list_month_begin = pd.concat([pd.Series(pd.to_datetime(self.start_date)), pd.Series(list_month_begin)],
-                                     ignore_index=True)
+        list_month_begin = pd.DatetimeIndex([self.start_date_datetime]).append(
+            pd.date_range(self.start_date_datetime, self.end_date_datetime, freq='MS', inclusive='right'))
+        list_month_end = pd.date_range(self.start_date_datetime, self.end_date_datetime, freq=_MONTH_END,
+                                       inclusive='left').append(pd.DatetimeIndex([self.end_date_datetime]))
 
-        list_month_end = pd.date_range(self.start_date_datetime, self.end_date_datetime, freq='M', closed='left')
-        list_month_end = pd.concat([pd.Series(list_month_end), pd.Series(pd.to_datetime(self.end_date))],
-                                   ignore_index=True)
+        month_ranges = [(start_ts.strftime('%Y-%m-%d'), end_ts.strftime('%Y-%m-%d'))
+                        for start_ts, end_ts in zip(list_month_begin, list_month_end)]
 
-        total_months = len(list_month_begin)
+        with ThreadPoolExecutor(self._MAX_CONCURRENT_REQUESTS) as executor:
+            monthly_data = list(executor.map(lambda month_range: self._fetch_month(city, *month_range),
+                                             month_ranges))
 
-        historical_data = pd.DataFrame()
-        for m in range(total_months):
-            start_d = str(list_month_begin[m])[:10]
-            end_d = str(list_month_end[m])[:10]
-            if self.verbose:
-                print('Retrieving data for ' + city + ' from: ' + start_d + ' to: ' + end_d)
-            url_page = 'http://api.worldweatheronline.com/premium/v1/past-weather.' \
-                       'ashx?key={}&q={}&format=json&date={}&enddate={}&tp={}'.format(self.api_key,
-                                                                                      city,
-                                                                                      start_d,
-                                                                                      end_d,
-                                                                                      str(self.frequency))
-            json_page = urllib.request.urlopen(url_page, timeout=10)
-            json_data = json.loads(json_page.read().decode())
-            data = json_data['data']['weather']
-
-            data_this_month = self._extract_data(data)
-            data_this_month['city'] = city
-            historical_data = pd.concat([historical_data, data_this_month])
-
-            time_elapsed = datetime.now() - start_time
-            if self.verbose:
-                print('Time elapsed (hh:mm:ss.ms) {}'.format(time_elapsed))
+        for data_this_month in monthly_data:
+            data_this_month['city'] = pd.Categorical([city] * len(data_this_month))
+        historical_data = pd.concat(monthly_data, ignore_index=False)
+        # Days without an astronomy block take the previous day's values; leading gaps stay missing.
+        astronomy_columns = [c for c in self._ASTRONOMY_COLUMNS if c in historical_data.columns]
+        if historical_data[astronomy_columns].isna().any().any():
+            historical_data[astronomy_columns] = historical_data[astronomy_columns].ffill()
+        for column in self._CATEGORICAL_COLUMNS:
+            if column in historical_data.columns:
+                historical_data[column] = historical_data[column].astype('category')
+
+        time_elapsed = datetime.now() - start_time
+        if self.verbose:
+            print('Time elapsed (hh:mm:ss.ms) {}'.format(time_elapsed))
 
         return historical_data
 
     def retrieve_hist_data(self):
         """
         This function calls the above internal functions, collecting the data from the
-        WorldWeatherOnline API. If a csv directory is provided, a csv file shall be generated
-        and stored for this city. Additionally, a dataframe 'dataset' is materialised.
+        WorldWeatherOnline API. If a csv directory is provided, a csv or parquet file shall be
+        generated and stored for this city. Additionally, a dataframe 'dataset' is materialised.
 
         :returns: dataset: a Pandas DataFrame containing the requested historical data. (Pandas DataFrame)
         """
@@ -154,8 +328,55 @@ class HistoricalLocationWeather(object):
         dataset.set_index('date_time', drop=True, inplace=True)
 
         if self.csv_directory:
-            dataset.to_csv(self.csv_directory + '/' + self.city + '.csv', header=True, index=True)
+            if self.output_format == 'parquet':
+                pq.write_table(pa.Table.from_pandas(dataset, preserve_index=True),
+                               self.csv_directory + '/' + self.city + '.parquet', compression='zstd')
+            else:
+                dataset.to_csv(self.csv_directory + '/' + self.city + '.csv', header=True, index=True)
             if self.verbose:
                 print('\n\nexport ' + self.city + ' completed!\n\n')
 
         return dataset
+
+
+def retrieve_many(api_key: str,
+                  cities: List[str],
+                  start_date: str,
+                  end_date: str,
+                  frequency: int,
+                  max_workers: int = 8,
+                  csv_directory: Optional[str] = os.getcwd(),
+                  output_format: str = 'csv',
+                  attributes: Optional[List[str]] = None,
+                  rate_limit_rps: float = 5.0,
+                  cache_name: str = 'wwo_cache') -> Dict[str, pd.DataFrame]:
+    """
+    This function retrieves historical weather data for several cities concurrently,
+    sharing a single connection pool, response cache and rate limit between all cities.
+
+    :param api_key: the API key obtained from 'https://www.worldweatheronline.com/developer/'. (str)
+    :param cities: the cities for which to retrieve data, without duplicates. (list)
+    :param start_date: The date from which to begin data extraction, in the format 'YYYY-MM-DD'. (str)
+    :param end_date: The date at which to end data extraction, in the format 'YYYY-MM-DD'. (str)
+    :param frequency: the frequency of extracted data, measured in hours. (int)
+    :param max_workers: the maximum number of cities retrieved at once. (int)
+    :param csv_directory: an optional file directory to store the output, or None to skip it. (os directory)
+    :param output_format: the file format of the stored output, either 'csv' or 'parquet'. (str)
+    :param attributes: an optional list of weather attributes to collect in place of the defaults. (list)
+    :param rate_limit_rps: the maximum number of API requests made per second, across all cities. (float)
+    :param cache_name: the path of the SQLite response cache, without the '.sqlite' suffix. (str)
+    :return: datasets: a dictionary mapping each city to its Pandas DataFrame. (dict)
+    """
+    if len(set(cities)) != len(cities):
+        raise ValueError("The 'cities' argument must not contain duplicate cities.")
+
+    # Every worker may have _MAX_CONCURRENT_REQUESTS requests in flight on the shared pool.
+    session = _build_session(cache_name, max_workers * HistoricalLocationWeather._MAX_CONCURRENT_REQUESTS)
+    locations = [HistoricalLocationWeather(api_key, city, start_date, end_date, frequency, verbose=False,
+                                           csv_directory=csv_directory, output_format=output_format,
+                                           attributes=attributes, rate_limit_rps=rate_limit_rps,
+                                           cache_name=cache_name, session=session)
+                 for city in cities]
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        return dict(zip(cities, executor.map(HistoricalLocationWeather.retrieve_hist_data, locations)))
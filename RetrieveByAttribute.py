@@ -1,11 +1,21 @@
 import urllib
 import urllib.parse
 import urllib.request
-import json
+import gzip
 import pandas as pd
 from datetime import datetime
+from urllib.parse import urlencode
 import os
 
+try:
+  from orjson import loads as json_loads
+except ImportError:
+  from json import loads as json_loads
+
+_BASE_URL = 'http://api.worldweatheronline.com/premium/v1/past-weather.ashx'
+# pandas 2.2 renamed the month-end frequency alias from 'M' to 'ME'; pandas 3 rejects 'M'.
+_MONTH_END = 'ME' if tuple(int(v) for v in pd.__version__.split('.')[:2]) >= (2, 2) else 'M'
+
 class RetrieveByAttribute(object):
   '''
   This class extracts Historical user defined weather attributes from the 
@@ -43,7 +53,7 @@ class RetrieveByAttribute(object):
 
     if isinstance(attribute_list, list) is False:
       raise TypeError("The 'attribute_list' argument must be a list object.")
-    if all(isinstance(n, str) for n in lst) is False:
+    if all(isinstance(n, str) for n in attribute_list) is False:
       raise ValueError("The 'attribute_list' contents must be string objects.")
 
     if isinstance(city, str) is False:
@@ -103,14 +113,13 @@ class RetrieveByAttribute(object):
       weather_data = pd.DataFrame(subset_d, index=[0])
       data = pd.concat([weather_data.reset_index(drop=True), astronomy_data], axis=1)
       data = pd.concat([data, hourly_data], axis=1)
-      data = data.fillna(method='ffill')
+      data = data.ffill()
 
       data['time'] = data['time'].apply(lambda x: x.zfill(4))
       data['time'] = data['time'].str[:2]
-      data['date_time'] = pd.to_datetime(data['date'] + ' ' + data['time'])
+      data['date_time'] = pd.to_datetime(data['date'] + ' ' + data['time'], format = '%Y-%m-%d %H')
 
-      columns_required = self.attribute_list
-      columns_required.extend(['date_time'])
+      columns_required = self.attribute_list + ['date_time']
 
       data = data[columns_required]
       data = data.loc[:,~data.columns.duplicated()]
@@ -134,10 +143,10 @@ class RetrieveByAttribute(object):
     '''
     start_time = datetime.now()
 
-    list_month_begin = pd.date_range(self.start_date, self.end_date, freq = 'MS', closed = 'right')
+    list_month_begin = pd.date_range(self.start_date, self.end_date, freq = 'MS', inclusive = 'right')
     list_month_begin = pd.concat([pd.Series(pd.to_datetime(self.start_date)), pd.Series(list_month_begin)], ignore_index = True)
 
-    list_month_end = pd.date_range(self.start_date_datetime, self.end_date_datetime, freq='M', closed='left')
+    list_month_end = pd.date_range(self.start_date_datetime, self.end_date_datetime, freq=_MONTH_END, inclusive='left')
     list_month_end = pd.concat([pd.Series(list_month_end), pd.Series(pd.to_datetime(self.end_date))], ignore_index=True)
 
     total_months = len(list_month_begin)
@@ -148,9 +157,14 @@ class RetrieveByAttribute(object):
       end_d = str(list_month_end[m])[:10]
       if self.verbose:
         print('Retrieving data for ' + city + ' from: ' + start_d + ' to: ' + end_d)
-      url_page = 'http://api.worldweatheronline.com/premium/v1/past-weather.ashx?key=' + self.api_key + '&q=' + city + '&format=json&date=' + start_d + '&enddate=' + end_d + '&tp=' + str(self.frequency)
-      json_page = urllib.request.urlopen(url_page, timeout=10)
-      json_data = json.loads(json_page.read().decode())
+      query = {'key': self.api_key, 'q': city, 'format': 'json', 'date': start_d, 'enddate': end_d, 'tp': self.frequency}
+      url_page = f'{_BASE_URL}?{urlencode(query)}'
+      request = urllib.request.Request(url_page, headers = {'Accept-Encoding': 'gzip'})
+      json_page = urllib.request.urlopen(request, timeout=10)
+      raw = json_page.read()
+      if json_page.headers.get('Content-Encoding') == 'gzip':
+        raw = gzip.decompress(raw)
+      json_data = json_loads(raw)
       data = json_data['data']['weather']
         
       data_this_month = self._extract_data(data)
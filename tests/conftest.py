@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HistoricalLocationWeather  # noqa: E402
+import RetrieveByAttribute  # noqa: E402
+
+
+def _weather_day(date: str, frequency: int) -> dict:
+    hourly = [{'time': str(hour * 100), 'tempC': '10', 'FeelsLikeC': '8', 'HeatIndexC': '10', 'WindChillC': '8',
+               'DewPointC': '5', 'WindGustKmph': '20', 'cloudcover': '50', 'humidity': '70', 'precipMM': '0.1',
+               'pressure': '1015', 'visibility': '10', 'winddirDegree': '180', 'windspeedKmph': '12',
+               'uvIndex': '1'}
+              for hour in range(0, 24, frequency)]
+    return {'date': date, 'maxtempC': '12', 'mintempC': '4', 'totalSnow_cm': '0.0', 'sunHour': '5.5',
+            'uvIndex': '4',
+            'astronomy': [{'sunrise': '08:00 AM', 'sunset': '04:00 PM', 'moonrise': '01:00 PM',
+                           'moonset': '03:00 AM', 'moon_illumination': '45'}],
+            'hourly': hourly}
+
+
+def _override(record: dict, overrides: dict):
+    for key, value in overrides.items():
+        if value is None:
+            record.pop(key, None)
+        else:
+            record[key] = value
+
+
+class _WWOServer(object):
+    """A local stand-in for the WorldWeatherOnline past-weather endpoint."""
+
+    def __init__(self, use_gzip: bool = False, payload=None, missing_astronomy=(), day_overrides=None,
+                 hourly_overrides=None):
+        self.use_gzip = use_gzip
+        self.payload = payload
+        self.missing_astronomy = missing_astronomy
+        self.day_overrides = day_overrides or {}
+        self.hourly_overrides = hourly_overrides or {}
+        self.hits = 0
+        self.request_times = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits += 1
+                server.request_times.append(time.monotonic())
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                body = server.payload
+                if body is None:
+                    dates = pd.date_range(query['date'], query['enddate']).strftime('%Y-%m-%d')
+                    body = {'data': {'weather': [_weather_day(d, int(query['tp'])) for d in dates]}}
+                    for day in body['data']['weather']:
+                        if day['date'] in server.missing_astronomy:
+                            del day['astronomy']
+                        _override(day, server.day_overrides)
+                        for hour in day['hourly']:
+                            _override(hour, server.hourly_overrides)
+                content = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if server.use_gzip:
+                    content = gzip.compress(content)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/premium/v1/past-weather.ashx'.format(self._httpd.server_port)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def wwo_server(monkeypatch, tmp_path):
+    servers = []
+
+    def start(**kwargs):
+        server = _WWOServer(**kwargs)
+        servers.append(server)
+        monkeypatch.setattr(HistoricalLocationWeather, '_BASE_URL', server.url)
+        monkeypatch.setattr(RetrieveByAttribute, '_BASE_URL', server.url)
+        return server
+
+    monkeypatch.chdir(tmp_path)
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,200 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import HistoricalLocationWeather as hlw_module
+from HistoricalLocationWeather import HistoricalLocationWeather
+
+API_KEY = 'a' * 31
+
+
+def _retrieve(tmp_path, **kwargs):
+    return HistoricalLocationWeather(API_KEY, 'London', '2019-01-15', '2019-02-10', 3, verbose=False,
+                                     csv_directory=str(tmp_path), **kwargs).retrieve_hist_data()
+
+
+@pytest.mark.parametrize('use_gzip', [False, True])
+def test_repeated_range_is_served_from_cache(wwo_server, tmp_path, use_gzip):
+    server = wwo_server(use_gzip=use_gzip)
+
+    first = _retrieve(tmp_path)
+    assert server.hits == 2
+    second = _retrieve(tmp_path)
+    assert server.hits == 2
+
+    assert first.shape == (27 * 8, 24)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_error_payload_raises(wwo_server, tmp_path):
+    wwo_server(payload={'data': {'error': [{'msg': 'Unable to find any matching weather location.'}]}})
+
+    with pytest.raises(ValueError, match='no weather data'):
+        _retrieve(tmp_path)
+
+
+def test_error_payload_is_not_cached(wwo_server, tmp_path):
+    server = wwo_server(payload={'data': {'error': [{'msg': 'API key has reached calls per day allowed limit.'}]}})
+    weather = HistoricalLocationWeather(API_KEY, 'London', '2019-01-15', '2019-01-20', 3, verbose=False,
+                                        csv_directory=str(tmp_path), cache_name=str(tmp_path / 'cache'))
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            weather.retrieve_hist_data()
+    assert server.hits == 2
+    assert (tmp_path / 'cache.sqlite').exists()
+
+
+def test_daily_values_take_precedence_over_hourly(wwo_server, tmp_path):
+    wwo_server()
+
+    dataset = _retrieve(tmp_path)
+
+    assert (dataset['uvIndex'] == 4).all()
+    assert (dataset['tempC'] == 10).all()
+
+
+def test_hourly_values_used_when_daily_value_is_missing(wwo_server, tmp_path):
+    wwo_server(day_overrides={'uvIndex': None})
+
+    dataset = _retrieve(tmp_path)
+
+    assert (dataset['uvIndex'] == 1).all()
+
+
+def test_days_without_astronomy_are_forward_filled(wwo_server, tmp_path):
+    wwo_server(missing_astronomy=('2019-01-15', '2019-01-20', '2019-02-01'))
+
+    dataset = _retrieve(tmp_path)
+
+    astronomy = dataset[['moon_illumination', 'moonrise', 'moonset', 'sunrise', 'sunset']]
+    assert astronomy.loc['2019-01-15'].isna().all().all()
+    assert not astronomy.loc['2019-01-16':].isna().any().any()
+    assert (dataset.loc['2019-01-16':, 'moon_illumination'] == 45).all()
+
+
+def test_leading_month_without_astronomy_keeps_missing_values(wwo_server, tmp_path):
+    wwo_server(missing_astronomy=tuple(pd.date_range('2019-01-15', '2019-01-31').strftime('%Y-%m-%d')))
+
+    dataset = _retrieve(tmp_path)
+
+    assert dataset.loc[:'2019-01-31', 'moon_illumination'].isna().all()
+    assert (dataset.loc['2019-02-01':, 'moon_illumination'] == 45).all()
+
+
+def test_csv_output_does_not_depend_on_pyarrow(wwo_server, tmp_path, monkeypatch):
+    wwo_server()
+
+    _retrieve(tmp_path)
+    with_pyarrow = (tmp_path / 'London.csv').read_text()
+    monkeypatch.setattr(hlw_module, 'pa', None)
+    _retrieve(tmp_path)
+    without_pyarrow = (tmp_path / 'London.csv').read_text()
+
+    assert with_pyarrow == without_pyarrow
+    lines = with_pyarrow.splitlines()
+    assert lines[0].startswith('date_time,maxtempC,mintempC,totalSnow_cm,')
+    assert lines[1].startswith('2019-01-15 00:00:00,12,4,0.0,5.5,4,45,01:00 PM,')
+    assert lines[1].endswith(',London')
+
+
+def test_rate_limit_is_shared_between_instances(wwo_server, tmp_path):
+    server = wwo_server()
+
+    def retrieve_city(city):
+        return HistoricalLocationWeather(API_KEY, city, '2019-01-15', '2019-02-10', 3, verbose=False,
+                                         csv_directory=str(tmp_path), rate_limit_rps=10.0).retrieve_hist_data()
+
+    with ThreadPoolExecutor(3) as executor:
+        list(executor.map(retrieve_city, ['London', 'Paris', 'Berlin']))
+
+    request_times = sorted(server.request_times)
+    assert len(request_times) == 6
+    assert request_times[-1] - request_times[0] >= 0.45
+
+
+def test_retrieve_many(wwo_server, tmp_path):
+    wwo_server()
+
+    datasets = hlw_module.retrieve_many(API_KEY, ['London', 'Paris'], '2019-01-15', '2019-02-10', 3,
+                                        csv_directory=None, attributes=['tempC'])
+
+    assert list(datasets) == ['London', 'Paris']
+    assert list(datasets['Paris'].columns) == ['tempC', 'city']
+    assert (datasets['Paris']['city'] == 'Paris').all()
+    assert not list(tmp_path.glob('*.csv'))
+
+
+def test_retrieve_many_rejects_duplicate_cities(wwo_server):
+    wwo_server()
+
+    with pytest.raises(ValueError, match='duplicate'):
+        hlw_module.retrieve_many(API_KEY, ['London', 'London'], '2019-01-15', '2019-02-10', 3)
+
+
+def test_retrieve_hist_data_inside_running_event_loop(wwo_server, tmp_path):
+    wwo_server()
+
+    async def main():
+        return _retrieve(tmp_path)
+
+    assert asyncio.run(main()).shape == (27 * 8, 24)
+
+
+def test_api_key_is_not_written_to_cache(wwo_server, tmp_path):
+    wwo_server()
+    api_key = 'secretkey' + 'x' * 22
+
+    for _ in range(2):
+        HistoricalLocationWeather(api_key, 'London', '2019-01-15', '2019-01-20', 3, verbose=False,
+                                  csv_directory=None, cache_name=str(tmp_path / 'cache')).retrieve_hist_data()
+
+    assert b'secretkey' not in (tmp_path / 'cache.sqlite').read_bytes()
+
+
+def test_attributes_select_columns(wwo_server, tmp_path):
+    wwo_server()
+
+    dataset = _retrieve(tmp_path, attributes=['date_time', 'sunrise', 'tempC', 'uvIndex', 'tempC'])
+
+    assert list(dataset.columns) == ['sunrise', 'tempC', 'uvIndex', 'city']
+    assert dataset.index.name == 'date_time'
+    assert (dataset['sunrise'] == '08:00 AM').all()
+    assert (dataset['uvIndex'] == 4).all()
+
+
+def test_unknown_attributes_raise(wwo_server, tmp_path):
+    wwo_server()
+
+    with pytest.raises(ValueError, match='not_an_attribute'):
+        _retrieve(tmp_path, attributes=['tempC', 'not_an_attribute'])
+
+
+def test_non_numeric_values_become_missing(wwo_server, tmp_path):
+    wwo_server(hourly_overrides={'visibility': '', 'pressure': 'n/a'})
+
+    dataset = _retrieve(tmp_path)
+
+    assert dataset['visibility'].isna().all()
+    assert dataset['pressure'].isna().all()
+    assert str(dataset['tempC'].dtype) == 'Int16'
+
+
+def test_retrieve_many_sizes_connection_pool_for_all_workers(wwo_server, monkeypatch):
+    wwo_server()
+    sessions = []
+    original_build_session = hlw_module._build_session
+
+    def build_session(*args, **kwargs):
+        sessions.append(original_build_session(*args, **kwargs))
+        return sessions[-1]
+
+    monkeypatch.setattr(hlw_module, '_build_session', build_session)
+
+    hlw_module.retrieve_many(API_KEY, ['London', 'Paris'], '2019-01-15', '2019-02-10', 3,
+                             max_workers=4, csv_directory=None)
+
+    assert len(sessions) == 1
+    assert sessions[0].get_adapter(hlw_module._BASE_URL)._pool_maxsize == 4 * 5
@@ -0,0 +1,26 @@
+import pytest
+
+from RetrieveByAttribute import RetrieveByAttribute
+
+API_KEY = 'a' * 31
+
+
+@pytest.mark.parametrize('use_gzip', [False, True])
+def test_retrieve_hist_data(wwo_server, tmp_path, use_gzip):
+    server = wwo_server(use_gzip=use_gzip)
+    attribute_list = ['tempC', 'sunrise']
+
+    dataset = RetrieveByAttribute(API_KEY, attribute_list, 'São Paulo', '2019-01-15', '2019-02-10', 3,
+                                  verbose=False, csv_directory=str(tmp_path)).retrieve_hist_data()
+
+    assert server.hits == 2
+    assert dataset.shape == (27 * 8, 3)
+    assert list(dataset.columns) == ['tempC', 'sunrise', 'city']
+    assert (dataset['city'] == 'São Paulo').all()
+    assert attribute_list == ['tempC', 'sunrise']
+    assert (tmp_path / 'São Paulo.csv').exists()
+
+
+def test_attribute_list_must_contain_strings():
+    with pytest.raises(ValueError):
+        RetrieveByAttribute(API_KEY, ['tempC', 1], 'London', '2019-01-15', '2019-02-10', 3)